@@ -3,13 +3,25 @@ GitOps Infrastructure with Pulumi - Pure Python Implementation
 Creates AWS S3, SQS, IAM resources and Kubernetes integration using native Pulumi resources.
 """
 
-import json
+import asyncio
+import concurrent.futures
+import os
+from types import MappingProxyType
+
 import pulumi
 import pulumi_aws as aws
-import pulumi_kubernetes as k8s
+
+# Raise the asyncio default executor's thread count to match Pulumi's
+# --parallel setting; the stock executor caps at min(32, cpu_count + 4),
+# which throttles concurrent RPC/apply handling on small CI runners
+# (see pulumi/pulumi#11116)
+asyncio.get_event_loop().set_default_executor(
+    concurrent.futures.ThreadPoolExecutor(
+        max_workers=int(os.environ.get("PULUMI_PARALLEL", "32"))
+    )
+)
 
 # Get configuration
-config = pulumi.Config()
 aws_config = pulumi.Config("aws")
 project_config = pulumi.Config("project")
 k8s_config = pulumi.Config("kubernetes")
@@ -17,14 +29,18 @@ k8s_config = pulumi.Config("kubernetes")
 region = aws_config.require("region")
 prefix = project_config.require("prefix")
 namespace = k8s_config.require("namespace")
+k8s_enabled = k8s_config.get_bool("enabled", True)
 
-# Tags to apply to all resources
-common_tags = {
-    "Environment": pulumi.get_stack(),
+STACK = pulumi.get_stack()
+
+# Tags to apply to all resources; frozen so the SDK can treat the shared
+# mapping as read-only instead of defensively copying it per resource
+common_tags = MappingProxyType({
+    "Environment": STACK,
     "Project": prefix,
     "ManagedBy": "Pulumi",
     "GitOps": "true"
-}
+})
 
 # ============================================================================
 # S3 Bucket Resources (equivalent to terraform s3-bucket module)
@@ -45,7 +61,8 @@ s3_versioning = aws.s3.BucketVersioningV2(
     bucket=s3_bucket.id,
     versioning_configuration=aws.s3.BucketVersioningV2VersioningConfigurationArgs(
         status="Enabled"
-    )
+    ),
+    opts=pulumi.ResourceOptions(parent=s3_bucket)
 )
 
 # Configure S3 bucket encryption
@@ -56,7 +73,8 @@ s3_encryption = aws.s3.BucketServerSideEncryptionConfigurationV2(
         apply_server_side_encryption_by_default=aws.s3.BucketServerSideEncryptionConfigurationV2RuleApplyServerSideEncryptionByDefaultArgs(
             sse_algorithm="AES256"
         )
-    )]
+    )],
+    opts=pulumi.ResourceOptions(parent=s3_bucket)
 )
 
 # Block public access to S3 bucket
@@ -66,30 +84,8 @@ s3_public_access_block = aws.s3.BucketPublicAccessBlock(
     block_public_acls=True,
     block_public_policy=True,
     ignore_public_acls=True,
-    restrict_public_buckets=True
-)
-
-# IAM policy for S3 access
-s3_access_policy = aws.iam.Policy(
-    "s3-access-policy",
-    name=f"{bucket_name}-access-policy",
-    description=f"Policy for accessing S3 bucket {bucket_name}",
-    policy=s3_bucket.arn.apply(lambda arn: json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "s3:GetObject",
-                    "s3:PutObject",
-                    "s3:DeleteObject",
-                    "s3:ListBucket"
-                ],
-                "Resource": [arn, f"{arn}/*"]
-            }
-        ]
-    })),
-    tags=common_tags
+    restrict_public_buckets=True,
+    opts=pulumi.ResourceOptions(parent=s3_bucket)
 )
 
 # ============================================================================
@@ -114,34 +110,10 @@ sqs_queue = aws.sqs.Queue(
     message_retention_seconds=345600,
     visibility_timeout_seconds=30,
     receive_wait_time_seconds=0,
-    redrive_policy=dlq.arn.apply(lambda dlq_arn: json.dumps({
-        "deadLetterTargetArn": dlq_arn,
+    redrive_policy=pulumi.Output.json_dumps({
+        "deadLetterTargetArn": dlq.arn,
         "maxReceiveCount": 3
-    })),
-    tags=common_tags
-)
-
-# IAM policy for SQS access
-sqs_access_policy = aws.iam.Policy(
-    "sqs-access-policy",
-    name=f"{queue_name}-access-policy",
-    description=f"Policy for accessing SQS queue {queue_name}",
-    policy=pulumi.Output.all(sqs_queue.arn, dlq.arn).apply(lambda arns: json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "sqs:SendMessage",
-                    "sqs:ReceiveMessage",
-                    "sqs:DeleteMessage",
-                    "sqs:GetQueueAttributes",
-                    "sqs:GetQueueUrl"
-                ],
-                "Resource": arns
-            }
-        ]
-    })),
+    }),
     tags=common_tags
 )
 
@@ -149,174 +121,230 @@ sqs_access_policy = aws.iam.Policy(
 # IRSA (IAM Roles for Service Accounts) Configuration
 # ============================================================================
 
-# Get current AWS account ID and partition
-current = aws.get_caller_identity()
-partition = aws.get_partition()
+# Get current AWS account ID and partition as Outputs so both invokes
+# resolve concurrently on the engine's event loop
+current = aws.get_caller_identity_output()
+partition = aws.get_partition_output()
 
 # Get EKS cluster OIDC issuer URL (assumes EKS cluster exists)
 cluster_name = f"{prefix}-cluster"
 
-# Try to get cluster info, but handle case where cluster doesn't exist yet
-try:
-    cluster = aws.eks.get_cluster(name=cluster_name)
-    cluster_exists = True
-except:
-    cluster_exists = False
-    pulumi.log.warn(f"EKS cluster '{cluster_name}' not found. IRSA will be configured but may not work until cluster exists.")
-
-def create_assume_role_policy_basic():
+# Role name is fixed up front so dependents can take the plain string instead
+# of waiting on the role's name Output
+role_name = f"{prefix}-k8s-service-role"
+
+def _lookup_cluster(name):
+    """Tolerant EKS cluster lookup; returns None when the cluster doesn't exist"""
+    try:
+        return aws.eks.get_cluster(name=name)
+    except Exception:
+        return None
+
+# Defer the blocking get_cluster call into an apply so it stays off the
+# import-time critical path. The output-form invoke can't be used here: it
+# rejects its Output when the cluster is missing and no downstream apply can
+# catch that, whereas this lookup resolves to None and the policy builder
+# falls back to the basic trust policy
+cluster = pulumi.Output.from_input(cluster_name).apply(_lookup_cluster)
+
+def create_assume_role_policy_basic(account_id, partition_name):
     """Create a basic assume role policy that works without EKS cluster"""
-    return json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Principal": {
-                    "AWS": f"arn:{partition.partition}:iam::{current.account_id}:root"
-                },
-                "Action": "sts:AssumeRole",
-                "Condition": {
-                    "StringEquals": {
-                        "sts:ExternalId": f"{prefix}-external-id"
-                    }
-                }
-            }
-        ]
-    })
-
-def create_assume_role_policy_irsa(cluster_data):
-    """Create the assume role policy for IRSA when cluster exists"""
-    oidc_url = cluster_data.identities[0].oidcs[0].issuer
-    oidc_arn = f"arn:{partition.partition}:iam::{current.account_id}:oidc-provider/{oidc_url.replace('https://', '')}"
-    
-    return json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Principal": {
-                    "Federated": oidc_arn
-                },
-                "Action": "sts:AssumeRoleWithWebIdentity",
-                "Condition": {
-                    "StringEquals": {
-                        f"{oidc_url.replace('https://', '')}:sub": f"system:serviceaccount:{namespace}:{prefix}-service-account",
-                        f"{oidc_url.replace('https://', '')}:aud": "sts.amazonaws.com"
-                    }
-                }
-            }
-        ]
-    })
+    return aws.iam.get_policy_document_output(statements=[
+        aws.iam.GetPolicyDocumentStatementArgs(
+            effect="Allow",
+            principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+                type="AWS",
+                identifiers=[f"arn:{partition_name}:iam::{account_id}:root"]
+            )],
+            actions=["sts:AssumeRole"],
+            conditions=[aws.iam.GetPolicyDocumentStatementConditionArgs(
+                test="StringEquals",
+                variable="sts:ExternalId",
+                values=[f"{prefix}-external-id"]
+            )]
+        )
+    ]).json
+
+def create_assume_role_policy_irsa(account_id, partition_name, cluster_data):
+    """Create the assume role policy for IRSA, falling back to the basic policy
+    when the cluster (or its OIDC identity) doesn't exist yet"""
+    try:
+        oidc_url = cluster_data.identities[0].oidcs[0].issuer
+    except (AttributeError, IndexError):
+        pulumi.log.warn(f"EKS cluster '{cluster_name}' not found. IRSA will be configured but may not work until cluster exists.")
+        return create_assume_role_policy_basic(account_id, partition_name)
+    oidc_host = oidc_url.replace('https://', '', 1)
+
+    return aws.iam.get_policy_document_output(statements=[
+        aws.iam.GetPolicyDocumentStatementArgs(
+            effect="Allow",
+            principals=[aws.iam.GetPolicyDocumentStatementPrincipalArgs(
+                type="Federated",
+                identifiers=[f"arn:{partition_name}:iam::{account_id}:oidc-provider/{oidc_host}"]
+            )],
+            actions=["sts:AssumeRoleWithWebIdentity"],
+            conditions=[
+                aws.iam.GetPolicyDocumentStatementConditionArgs(
+                    test="StringEquals",
+                    variable=f"{oidc_host}:sub",
+                    values=[f"system:serviceaccount:{namespace}:{prefix}-service-account"]
+                ),
+                aws.iam.GetPolicyDocumentStatementConditionArgs(
+                    test="StringEquals",
+                    variable=f"{oidc_host}:aud",
+                    values=["sts.amazonaws.com"]
+                )
+            ]
+        )
+    ]).json
 
 # Create IAM role for Kubernetes ServiceAccount
-if cluster_exists:
-    assume_role_policy = cluster.apply(create_assume_role_policy_irsa)
-else:
-    assume_role_policy = create_assume_role_policy_basic()
+assume_role_policy = pulumi.Output.all(current, partition, cluster).apply(
+    lambda args: create_assume_role_policy_irsa(args[0].account_id, args[1].partition, args[2])
+)
 
 service_account_role = aws.iam.Role(
     "service-account-role",
-    name=f"{prefix}-k8s-service-role",
+    name=role_name,
     assume_role_policy=assume_role_policy,
     tags=common_tags
 )
 
-# Attach S3 policy to service account role
-s3_policy_attachment = aws.iam.RolePolicyAttachment(
-    "s3-policy-attachment",
-    role=service_account_role.name,
-    policy_arn=s3_access_policy.arn
-)
-
-# Attach SQS policy to service account role
-sqs_policy_attachment = aws.iam.RolePolicyAttachment(
-    "sqs-policy-attachment",
-    role=service_account_role.name,
-    policy_arn=sqs_access_policy.arn
+# Single inline policy granting both S3 and SQS access; one IAM call instead
+# of two managed policies plus two attachments
+app_access_policy = aws.iam.RolePolicy(
+    "app-access-policy",
+    name=f"{prefix}-app-access-policy",
+    role=role_name,
+    policy=aws.iam.get_policy_document_output(statements=[
+        aws.iam.GetPolicyDocumentStatementArgs(
+            effect="Allow",
+            actions=[
+                "s3:GetObject",
+                "s3:PutObject",
+                "s3:DeleteObject",
+                "s3:ListBucket"
+            ],
+            resources=[s3_bucket.arn, s3_bucket.arn.apply(lambda arn: f"{arn}/*")]
+        ),
+        aws.iam.GetPolicyDocumentStatementArgs(
+            effect="Allow",
+            actions=[
+                "sqs:SendMessage",
+                "sqs:ReceiveMessage",
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+                "sqs:GetQueueUrl"
+            ],
+            resources=[sqs_queue.arn, dlq.arn]
+        )
+    ]).json,
+    opts=pulumi.ResourceOptions(depends_on=[service_account_role])
 )
 
 # ============================================================================
 # Kubernetes Resources
 # ============================================================================
 
-# Create Kubernetes namespace
-k8s_namespace = k8s.core.v1.Namespace(
-    "app-namespace",
-    metadata=k8s.meta.v1.ObjectMetaArgs(
-        name=namespace,
-        labels={
-            "name": namespace,
-            "app.kubernetes.io/managed-by": "Pulumi",
-            "gitops.io/environment": pulumi.get_stack()
-        }
-    )
-)
+if k8s_enabled:
+    # Import lazily so AWS-only stacks skip loading the k8s SDK entirely
+    import pulumi_kubernetes as k8s
 
-# Create Kubernetes ServiceAccount with IAM role annotation
-service_account = k8s.core.v1.ServiceAccount(
-    "service-account",
-    metadata=k8s.meta.v1.ObjectMetaArgs(
-        name=f"{prefix}-service-account",
-        namespace=namespace,
-        annotations={
-            "eks.amazonaws.com/role-arn": service_account_role.arn
-        },
-        labels={
-            "app.kubernetes.io/name": f"{prefix}-service-account",
-            "app.kubernetes.io/managed-by": "Pulumi",
-            "gitops.io/environment": pulumi.get_stack()
-        }
-    ),
-    opts=pulumi.ResourceOptions(depends_on=[k8s_namespace])
-)
+    service_account_name = f"{prefix}-service-account"
 
-# Create ConfigMap with AWS resource information
-config_map = k8s.core.v1.ConfigMap(
-    "aws-resources-config",
-    metadata=k8s.meta.v1.ObjectMetaArgs(
-        name=f"{prefix}-aws-resources",
-        namespace=namespace,
-        labels={
-            "app.kubernetes.io/name": f"{prefix}-config",
-            "app.kubernetes.io/managed-by": "Pulumi",
-            "gitops.io/environment": pulumi.get_stack()
-        }
-    ),
-    data={
-        "S3_BUCKET_NAME": s3_bucket.bucket,
-        "SQS_QUEUE_URL": sqs_queue.url,
-        "SQS_QUEUE_NAME": sqs_queue.name,
-        "SQS_DLQ_URL": dlq.url,
+    # ConfigMap keys that are plain strings known at import time; kept out of
+    # the Output-bearing entries so they carry no dependency tracking
+    static_config_data = {
         "AWS_REGION": region,
         "AWS_DEFAULT_REGION": region
-    },
-    opts=pulumi.ResourceOptions(depends_on=[k8s_namespace])
-)
+    }
+
+    # Apply the namespace, ServiceAccount, and ConfigMap as one batched
+    # manifest group instead of three sequentially ordered apiserver writes;
+    # the provider sequences the namespace ahead of its members internally
+    app_manifests = k8s.yaml.v2.ConfigGroup(
+        "app-manifests",
+        objs=[
+            {
+                "apiVersion": "v1",
+                "kind": "Namespace",
+                "metadata": {
+                    "name": namespace,
+                    "labels": {
+                        "name": namespace,
+                        "app.kubernetes.io/managed-by": "Pulumi",
+                        "gitops.io/environment": STACK
+                    }
+                }
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "ServiceAccount",
+                "metadata": {
+                    "name": service_account_name,
+                    "namespace": namespace,
+                    "annotations": {
+                        "eks.amazonaws.com/role-arn": service_account_role.arn
+                    },
+                    "labels": {
+                        "app.kubernetes.io/name": service_account_name,
+                        "app.kubernetes.io/managed-by": "Pulumi",
+                        "gitops.io/environment": STACK
+                    }
+                }
+            },
+            {
+                "apiVersion": "v1",
+                "kind": "ConfigMap",
+                "metadata": {
+                    "name": f"{prefix}-aws-resources",
+                    "namespace": namespace,
+                    "labels": {
+                        "app.kubernetes.io/name": f"{prefix}-config",
+                        "app.kubernetes.io/managed-by": "Pulumi",
+                        "gitops.io/environment": STACK
+                    }
+                },
+                "data": {
+                    **static_config_data,
+                    "S3_BUCKET_NAME": s3_bucket.bucket,
+                    "SQS_QUEUE_URL": sqs_queue.url,
+                    "SQS_QUEUE_NAME": sqs_queue.name,
+                    "SQS_DLQ_URL": dlq.url
+                }
+            }
+        ]
+    )
 
 # ============================================================================
 # Outputs
 # ============================================================================
 
-# Export all important outputs
-pulumi.export("bucket_name", s3_bucket.bucket)
-pulumi.export("bucket_arn", s3_bucket.arn)
-pulumi.export("bucket_domain_name", s3_bucket.bucket_domain_name)
-pulumi.export("queue_url", sqs_queue.url)
-pulumi.export("queue_arn", sqs_queue.arn)
-pulumi.export("queue_name", sqs_queue.name)
-pulumi.export("dlq_url", dlq.url)
-pulumi.export("dlq_arn", dlq.arn)
-pulumi.export("service_account_role_arn", service_account_role.arn)
-pulumi.export("service_account_role_name", service_account_role.name)
-pulumi.export("kubernetes_namespace", namespace)
-pulumi.export("kubernetes_service_account_name", service_account.metadata.name)
-pulumi.export("s3_access_policy_arn", s3_access_policy.arn)
-pulumi.export("sqs_access_policy_arn", sqs_access_policy.arn)
-
-# Export configuration for debugging
-pulumi.export("config", {
-    "region": region,
-    "prefix": prefix,
-    "namespace": namespace,
-    "stack": pulumi.get_stack()
-})
+# Export all important outputs as one batch so the engine registers a single
+# stack output instead of one RPC per value; consumers read
+# stack.get_output("outputs")["<key>"]
+outputs = {
+    "bucket_name": s3_bucket.bucket,
+    "bucket_arn": s3_bucket.arn,
+    "bucket_domain_name": s3_bucket.bucket_domain_name,
+    "queue_url": sqs_queue.url,
+    "queue_arn": sqs_queue.arn,
+    "queue_name": sqs_queue.name,
+    "dlq_url": dlq.url,
+    "dlq_arn": dlq.arn,
+    "service_account_role_arn": service_account_role.arn,
+    "service_account_role_name": service_account_role.name,
+    "kubernetes_namespace": namespace,
+    "app_access_policy_name": app_access_policy.name,
+    # Configuration for debugging
+    "config": {
+        "region": region,
+        "prefix": prefix,
+        "namespace": namespace,
+        "stack": STACK
+    }
+}
+if k8s_enabled:
+    outputs["kubernetes_service_account_name"] = service_account_name
+
+pulumi.export("outputs", outputs)